@@ -1,7 +1,7 @@
 from sqlalchemy.orm import Session
 from typing import Dict, List
 import re
-import models, logic
+import models, logic, grading
 
 def get_student_context(student_id: int, db: Session) -> Dict:
     """
@@ -20,16 +20,11 @@ def get_student_context(student_id: int, db: Session) -> Dict:
     # We reuse the logic from the dashboard to see what is blocked and why.
     all_courses = db.query(models.Course).all()
     course_status_map = {}
+    passed_ids = grading.passed_course_ids(student_id, db)
     
     for course in all_courses:
-        # Check if passed
-        passed = db.query(models.Result).filter(
-            models.Result.student_id == student_id,
-            models.Result.course_id == course.course_id,
-            models.Result.grade != 'F'
-        ).first()
-
-        if passed:
+        # Check if passed (according to the department's grading scale)
+        if course.course_id in passed_ids:
             status = "Completed"
             reason = "Passed"
         else:
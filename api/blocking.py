@@ -0,0 +1,338 @@
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.orm.attributes import get_history
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+import threading
+import models, grading
+
+# Reverse index from a prerequisite course to the students it blocks (models.BlockedPrerequisite).
+#
+# A (student, prerequisite) row exists while the student has not passed the prerequisite:
+#   'failed'  - attempted, but no attempt passes under the department's grading scale
+#   'missing' - not attempted yet, and required: a course of the student's department depends on it
+# Rows are kept up to date from a session 'after_flush' hook, in the same transaction as the
+# result/student/prerequisite write. Queries are then a lookup on prerequisite_course_id, so their
+# cost grows with the number of affected students, not students x catalog.
+# Students without a department only get 'failed' rows.
+
+_students = models.Student.__table__
+_results = models.Result.__table__
+_blocked = models.BlockedPrerequisite.__table__
+
+# Alert subscribers, called after commit with the blocks newly caused by a failing result,
+# a stricter grading scale or a new prerequisite rule
+_alert_subscribers = []
+_alert_subscribers_lock = threading.Lock()
+
+
+def _prerequisite_graph(conn) -> Tuple[Dict[int, Set[int]], Dict[int, str], Dict[int, Set[str]]]:
+    """
+    Returns (prerequisite course -> courses that directly require it,
+             prerequisite course -> its department, whose scale grades it,
+             prerequisite course -> departments of the courses that require it).
+    """
+    dependent = aliased(models.Course)
+    rows = conn.execute(
+        select(models.Prerequisite.prerequisite_course_id, models.Prerequisite.course_id,
+               models.Course.department, dependent.department)
+        .join(models.Course, models.Course.course_id == models.Prerequisite.prerequisite_course_id)
+        .outerjoin(dependent, dependent.course_id == models.Prerequisite.course_id)
+    ).all()
+
+    dependents = {}
+    departments = {}
+    needed_by = {}
+    for prerequisite_id, course_id, department, dependent_department in rows:
+        dependents.setdefault(prerequisite_id, set()).add(course_id)
+        departments[prerequisite_id] = department
+        needed_by.setdefault(prerequisite_id, set())
+        if dependent_department is not None:
+            needed_by[prerequisite_id].add(dependent_department)
+    return dependents, departments, needed_by
+
+
+def _downstream(dependents: Dict[int, Set[int]], course_id: int) -> Set[int]:
+    """
+    All courses blocked (directly or through a chain of prerequisites) until course_id is passed.
+    """
+    blocked = set()
+    stack = [course_id]
+    while stack:
+        for dependent in dependents.get(stack.pop(), ()):
+            if dependent not in blocked:
+                blocked.add(dependent)
+                stack.append(dependent)
+    return blocked
+
+
+def _status(grades: List[str], table: grading.GradeTable, required: bool) -> Optional[str]:
+    if any(table.is_pass(grade) for grade in grades):
+        return None
+    if grades:
+        return "failed"
+    return "missing" if required else None
+
+
+def _alert(dependents: Dict[int, Set[int]], student_id: int, course_id: int) -> Dict:
+    return {
+        "student_id": student_id,
+        "prerequisite_course_id": course_id,
+        "blocked_course_ids": sorted(_downstream(dependents, course_id))
+    }
+
+
+def _queue_alerts(db: Session, alerts: List[Dict]) -> None:
+    # Delivered by the 'after_commit' hook below, dropped on rollback
+    if alerts:
+        db.info.setdefault("pending_alerts", []).extend(alerts)
+
+
+def refresh_index(db: Session, pairs: Iterable[Tuple[int, int]],
+                  inserted: Iterable[Tuple[int, int]] = ()) -> List[Dict]:
+    """
+    Incremental maintenance: recomputes the index rows of the given (student_id, course_id) pairs.
+    Pairs whose course is not a prerequisite of anything are ignored.
+    `inserted` are the pairs that just received a new result.
+
+    Returns:
+        Alerts for pairs that just became 'failed', and for every new failing result
+        (a failed retake alerts again).
+    """
+    inserted = set(inserted)
+    conn = db.connection()
+    dependents, departments, needed_by = _prerequisite_graph(conn)
+    alerts = []
+
+    pairs = {(student_id, course_id) for student_id, course_id in pairs if course_id in dependents}
+    if not pairs:
+        return alerts
+
+    student_departments = dict(conn.execute(
+        select(_students.c.student_id, _students.c.department)
+        .where(_students.c.student_id.in_({student_id for student_id, course_id in pairs}))
+    ).all())
+
+    for student_id, course_id in pairs:
+        grades = conn.execute(
+            select(_results.c.grade).where(_results.c.student_id == student_id, _results.c.course_id == course_id)
+        ).scalars().all()
+        required = student_departments.get(student_id) in needed_by[course_id]
+        status = _status(grades, grading.get_table(departments[course_id], db), required)
+
+        key = (_blocked.c.student_id == student_id) & (_blocked.c.prerequisite_course_id == course_id)
+        previous = conn.execute(select(_blocked.c.status).where(key)).scalar()
+
+        if status == "failed" and (previous != "failed" or (student_id, course_id) in inserted):
+            alerts.append(_alert(dependents, student_id, course_id))
+
+        if status == previous:
+            continue
+
+        conn.execute(_blocked.delete().where(key))
+        if status is not None:
+            conn.execute(_blocked.insert().values(student_id=student_id, prerequisite_course_id=course_id, status=status))
+
+    return alerts
+
+
+def rebuild_index(db: Session, department: Optional[str] = None,
+                  course_ids: Optional[Iterable[int]] = None, alert: bool = True) -> int:
+    """
+    Full rebuild for every prerequisite course (of one department, or only `course_ids`, if given),
+    e.g. after a grading scale or prerequisite change. Uses one query for students, one for results
+    and one bulk insert; only students who attempted or require a course are visited.
+    With `alert`, pairs that become 'failed' (e.g. under a stricter scale or a new prerequisite)
+    are queued as alerts, delivered when the session commits.
+
+    Returns:
+        Number of index rows written.
+    """
+    conn = db.connection()
+    dependents, departments, needed_by = _prerequisite_graph(conn)
+    if course_ids is None:
+        course_ids = [c for c in dependents if department is None or departments[c] == department]
+    else:
+        # May include courses that are no longer prerequisites: their rows are only deleted
+        course_ids = list(course_ids)
+
+    previously_failed = set()
+    if alert and course_ids:
+        previously_failed = set(conn.execute(
+            select(_blocked.c.student_id, _blocked.c.prerequisite_course_id)
+            .where(_blocked.c.prerequisite_course_id.in_(course_ids), _blocked.c.status == "failed")
+        ).all())
+
+    conn.execute(_blocked.delete().where(_blocked.c.prerequisite_course_id.in_(course_ids)))
+    course_ids = [c for c in course_ids if c in dependents]
+    if not course_ids:
+        return 0
+
+    # course -> student -> grades of their attempts
+    grades = {course_id: {} for course_id in course_ids}
+    for student_id, course_id, grade in conn.execute(
+        select(_results.c.student_id, _results.c.course_id, _results.c.grade).where(_results.c.course_id.in_(course_ids))
+    ):
+        grades[course_id].setdefault(student_id, []).append(grade)
+
+    # Only students of departments that require one of the courses can be 'missing'
+    required_departments = set().union(*(needed_by[course_id] for course_id in course_ids))
+    students_by_department = {}
+    for student_id, student_department in conn.execute(
+        select(_students.c.student_id, _students.c.department).where(_students.c.department.in_(required_departments))
+    ):
+        students_by_department.setdefault(student_department, set()).add(student_id)
+
+    rows = []
+    alerts = []
+    for course_id in course_ids:
+        table = grading.get_table(departments[course_id], db)
+        required = set().union(*(students_by_department.get(d, set()) for d in needed_by[course_id]))
+        for student_id in required | set(grades[course_id]):
+            status = _status(grades[course_id].get(student_id, []), table, student_id in required)
+            if status is not None:
+                rows.append({"student_id": student_id, "prerequisite_course_id": course_id, "status": status})
+            if alert and status == "failed" and (student_id, course_id) not in previously_failed:
+                alerts.append(_alert(dependents, student_id, course_id))
+
+    if rows:
+        conn.execute(_blocked.insert(), rows)
+    _queue_alerts(db, alerts)
+    return len(rows)
+
+
+# --- Session hooks ---
+
+def _maintain_flush(session: Session, flush_context) -> None:
+    """
+    Session 'after_flush' hook: updates the index for the results, students and prerequisites just written.
+    """
+    # Attribute history still describes the flush here: `deleted` holds the values before it
+    def old_values(obj, attribute: str) -> List:
+        return list(get_history(obj, attribute).deleted) or [getattr(obj, attribute)]
+
+    written = list(session.new) + list(session.dirty) + list(session.deleted)
+
+    pairs = set()
+    for obj in written:
+        if isinstance(obj, models.Result):
+            pairs.add((obj.student_id, obj.course_id))
+            # An edited result may have moved to another student or course: refresh the old pair too
+            pairs |= {(s, c) for s in old_values(obj, "student_id") for c in old_values(obj, "course_id")}
+    inserted = {(obj.student_id, obj.course_id) for obj in session.new if isinstance(obj, models.Result)}
+
+    # New students, and students who changed department, may now require other prerequisites
+    students = [obj for obj in session.new if isinstance(obj, models.Student)]
+    students += [
+        obj for obj in session.dirty
+        if isinstance(obj, models.Student) and get_history(obj, "department").has_changes()
+    ]
+    deleted_students = [obj.student_id for obj in session.deleted if isinstance(obj, models.Student)]
+
+    # Prerequisite courses whose rules were added, changed or removed
+    rule_courses = set()
+    for obj in written:
+        if isinstance(obj, models.Prerequisite):
+            rule_courses.update(old_values(obj, "prerequisite_course_id"))
+            rule_courses.add(obj.prerequisite_course_id)
+
+    if not (pairs or students or deleted_students or rule_courses):
+        return
+
+    if deleted_students:
+        session.connection().execute(_blocked.delete().where(_blocked.c.student_id.in_(deleted_students)))
+
+    if rule_courses:
+        # Rebuild just the courses whose rules changed (this covers their pairs above too)
+        rebuild_index(session, course_ids=rule_courses)
+        pairs = {(student_id, course_id) for student_id, course_id in pairs if course_id not in rule_courses}
+
+    if students:
+        _, _, needed_by = _prerequisite_graph(session.connection())
+        for student in students:
+            student_departments = set(old_values(student, "department")) | {student.department}
+            pairs |= {
+                (student.student_id, course_id)
+                for course_id, departments in needed_by.items()
+                if departments & student_departments and course_id not in rule_courses
+            }
+
+    _queue_alerts(session, refresh_index(session, pairs, inserted))
+
+
+def _publish_alerts(session: Session) -> None:
+    """
+    Session 'after_commit' hook: delivers alerts only once the failing result is committed.
+    """
+    alerts = session.info.pop("pending_alerts", None)
+    if not alerts:
+        return
+
+    with _alert_subscribers_lock:
+        subscribers = list(_alert_subscribers)
+
+    for callback in subscribers:
+        try:
+            callback(alerts)
+        except Exception as e:
+            print(f"Error in blocked-prerequisite alert subscriber: {e}")
+
+
+def _discard_alerts(session: Session) -> None:
+    session.info.pop("pending_alerts", None)
+
+
+_HOOKS = (
+    ("after_flush", _maintain_flush),
+    ("after_commit", _publish_alerts),
+    ("after_rollback", _discard_alerts),
+)
+
+
+def track_blocking(session_factory) -> None:
+    """
+    Maintains the blocked-prerequisite index for every session created by `session_factory`.
+    Safe to call more than once.
+    """
+    for name, hook in _HOOKS:
+        if not event.contains(session_factory, name, hook):
+            event.listen(session_factory, name, hook)
+
+
+def subscribe_alerts(callback: Callable[[List[Dict]], None]) -> Callable[[], None]:
+    """
+    Registers `callback` to be called (in the committing thread) with a list of alerts
+    {student_id, prerequisite_course_id, blocked_course_ids} whenever a committed failing result,
+    scale change or new prerequisite rule leaves a student failing a prerequisite.
+
+    Returns:
+        A function that removes the subscription.
+    """
+    with _alert_subscribers_lock:
+        _alert_subscribers.append(callback)
+
+    def unsubscribe():
+        with _alert_subscribers_lock:
+            if callback in _alert_subscribers:
+                _alert_subscribers.remove(callback)
+
+    return unsubscribe
+
+
+# --- Queries ---
+
+def downstream_course_ids(course_id: int, db: Session) -> Set[int]:
+    """
+    Courses blocked (directly or transitively) by not passing course_id.
+    """
+    dependents, _, _ = _prerequisite_graph(db.connection())
+    return _downstream(dependents, course_id)
+
+
+def blocked_students(course_id: int, db: Session, status: Optional[str] = None) -> List[models.BlockedPrerequisite]:
+    """
+    Students blocked by prerequisite course_id, optionally only 'failed' or only 'missing'.
+    """
+    query = db.query(models.BlockedPrerequisite).filter(models.BlockedPrerequisite.prerequisite_course_id == course_id)
+    if status is not None:
+        query = query.filter(models.BlockedPrerequisite.status == status)
+    return query.order_by(models.BlockedPrerequisite.student_id).all()
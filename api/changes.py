@@ -0,0 +1,348 @@
+from sqlalchemy import bindparam, event, func, select
+from sqlalchemy.orm import Session, object_mapper
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+import models
+
+# Tables whose writes are recorded in the change log.
+TRACKED_MODELS = (
+    models.Student, models.Course, models.Semester, models.Result, models.Prerequisite,
+    models.GradingScale, models.GradeBand
+)
+
+# Upper bound for a single long-poll wait, and for the number of entries per feed response.
+MAX_POLL_TIMEOUT = 30.0
+MAX_FEED_LIMIT = 1000
+
+# Every shard (see sharding.py) keeps its own change log with its own change_ids.
+# Sessions name their shard in session.info["shard"]; sessions without one belong to main.
+MAIN_SHARD = "main"
+
+FEED_FIELDS = ("change_id", "entity", "entity_id", "version", "operation", "changed_at")
+
+# In-process subscribers: list of (callback, entity filter or None for all entities)
+_subscribers = []
+_subscribers_lock = threading.Lock()
+
+# Latest committed change_id per shard, and the asyncio events of waiting long-poll requests
+# (set from the committing thread after every commit that wrote change log rows)
+_latest_change_ids: Dict[str, int] = {}
+_waiters = set()
+_waiters_lock = threading.Lock()
+
+_change_log = models.ChangeLog.__table__
+
+# Statements are built once so every flush reuses the compiled form.
+# Latest version per written entity (a superset of the written pairs; filtered in Python).
+_LATEST_VERSIONS = select(
+    _change_log.c.entity, _change_log.c.entity_id, func.max(_change_log.c.version)
+).where(
+    _change_log.c.entity.in_(bindparam("entities", expanding=True)),
+    _change_log.c.entity_id.in_(bindparam("entity_ids", expanding=True))
+).group_by(_change_log.c.entity, _change_log.c.entity_id)
+
+_INSERT_CHANGE = _change_log.insert()
+
+
+def record_changes(session: Session, writes: Iterable[Tuple[str, int, str]]) -> None:
+    """
+    Writes one change log row per (entity, entity_id, operation) using the session's own
+    connection, so the log entry commits or rolls back together with the mutation.
+    Called automatically on flush; call it directly after Core bulk statements
+    (e.g., update()), which bypass the ORM session.
+    """
+    writes = list(writes)
+    if not writes:
+        return
+
+    conn = session.connection()
+    now = datetime.utcnow()
+    shard = session_shard(session)
+    pending = session.info.setdefault("pending_changes", [])
+
+    # Latest recorded version of every written entity, in one grouped query
+    versions = dict.fromkeys((entity, entity_id) for entity, entity_id, operation in writes)
+    for entity, entity_id, version in conn.execute(_LATEST_VERSIONS, {
+        "entities": list({entity for entity, entity_id in versions}),
+        "entity_ids": list({entity_id for entity, entity_id in versions})
+    }):
+        if (entity, entity_id) in versions:
+            versions[(entity, entity_id)] = version
+
+    for entity, entity_id, operation in writes:
+        # Next version = latest recorded version + 1 (ids can be reused after a delete)
+        version = (versions[(entity, entity_id)] or 0) + 1
+        versions[(entity, entity_id)] = version
+
+        inserted = conn.execute(_INSERT_CHANGE, {
+            "entity": entity,
+            "entity_id": entity_id,
+            "version": version,
+            "operation": operation,
+            "changed_at": now
+        })
+        pending.append({
+            "change_id": inserted.inserted_primary_key[0],
+            "entity": entity,
+            "entity_id": entity_id,
+            "version": version,
+            "operation": operation,
+            "changed_at": now,
+            "shard": shard
+        })
+
+
+def _record_flush(session: Session, flush_context) -> None:
+    """
+    Session 'after_flush' hook: logs every inserted/updated/deleted tracked object.
+    """
+    # At this point primary keys of new objects are assigned, but new/dirty/deleted
+    # still describe what was just flushed.
+    writes = [(obj, "insert") for obj in session.new]
+    writes += [(obj, "update") for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    writes += [(obj, "delete") for obj in session.deleted]
+
+    writes = [
+        (obj.__tablename__, object_mapper(obj).primary_key_from_instance(obj)[0], operation)
+        for obj, operation in writes
+        if isinstance(obj, TRACKED_MODELS)
+    ]
+    if writes:
+        record_changes(session, writes)
+
+
+def _publish_commit(session: Session) -> None:
+    """
+    Session 'after_commit' hook.
+    Only committed changes are announced, so subscribers never see a write that was rolled back.
+    """
+    committed = session.info.pop("pending_changes", None)
+    if not committed:
+        return
+
+    # 1. Wake up long-poll requests (each one waits on its own event loop)
+    shard = session_shard(session)
+    with _waiters_lock:
+        _latest_change_ids[shard] = max(_latest_change_ids.get(shard, 0), committed[-1]["change_id"])
+        waiters = list(_waiters)
+    for loop, waiter in waiters:
+        loop.call_soon_threadsafe(waiter.set)
+
+    # 2. Notify in-process subscribers (a failing subscriber must not affect the others)
+    with _subscribers_lock:
+        subscribers = list(_subscribers)
+
+    for callback, entities in subscribers:
+        selected = [c for c in committed if entities is None or c["entity"] in entities]
+        if not selected:
+            continue
+        try:
+            callback(selected)
+        except Exception as e:
+            print(f"Error in change subscriber: {e}")
+
+
+def _discard_pending(session: Session) -> None:
+    """
+    Session 'after_rollback' hook: the log rows were rolled back with the mutation.
+    """
+    session.info.pop("pending_changes", None)
+
+
+_HOOKS = (
+    ("after_flush", _record_flush),
+    ("after_commit", _publish_commit),
+    ("after_rollback", _discard_pending),
+)
+
+
+def track_changes(session_factory) -> None:
+    """
+    Enables change logging for every session created by `session_factory` (e.g., SessionLocal).
+    Safe to call more than once.
+    """
+    for name, hook in _HOOKS:
+        if not event.contains(session_factory, name, hook):
+            event.listen(session_factory, name, hook)
+
+
+def untrack_changes(session_factory) -> None:
+    """
+    Disables change logging for `session_factory`. Mainly useful for measuring overhead.
+    """
+    for name, hook in _HOOKS:
+        if event.contains(session_factory, name, hook):
+            event.remove(session_factory, name, hook)
+
+
+def subscribe(callback: Callable[[List[Dict]], None], entities: Optional[Iterable[str]] = None) -> Callable[[], None]:
+    """
+    Registers `callback` to be called (in the committing thread) with the list of changes
+    of every committed transaction. `entities` limits delivery to some tables, e.g. {"results"}.
+
+    Returns:
+        A function that removes the subscription.
+    """
+    entry = (callback, set(entities) if entities is not None else None)
+    with _subscribers_lock:
+        _subscribers.append(entry)
+
+    def unsubscribe():
+        with _subscribers_lock:
+            if entry in _subscribers:
+                _subscribers.remove(entry)
+
+    return unsubscribe
+
+
+def session_shard(session: Session) -> str:
+    return session.info.get("shard", MAIN_SHARD)
+
+
+# --- Feed ---
+# A feed cursor holds one change_id position per shard, e.g. "main:12,cs:3".
+# A plain number ("12") is the same position on every shard; shards not listed start at 0.
+# Parsed cursors are dicts of shard -> position, where key None holds the position of unlisted shards.
+
+def parse_cursor(cursor: str) -> Dict[Optional[str], int]:
+    """
+    Raises:
+        ValueError if the cursor is malformed.
+    """
+    positions = {None: 0}
+    cursor = cursor.strip()
+    if not cursor:
+        return positions
+    if ":" not in cursor:
+        positions[None] = int(cursor)
+        return positions
+
+    for entry in cursor.split(","):
+        shard, position = entry.rsplit(":", 1)
+        positions[shard.strip()] = int(position)
+    return positions
+
+
+def cursor_position(positions: Dict[Optional[str], int], shard: str) -> int:
+    return positions.get(shard, positions[None])
+
+
+def format_cursor(positions: Dict[str, int]) -> str:
+    return ",".join(f"{shard}:{position}" for shard, position in sorted(positions.items()) if shard is not None)
+
+
+def _feed_limit(limit: int) -> int:
+    # A non-positive LIMIT would read the whole log on SQLite (and break islice)
+    return max(1, min(limit, MAX_FEED_LIMIT))
+
+
+def fetch_changes(db: Session, since: int, limit: int = 100) -> List[models.ChangeLog]:
+    """
+    Returns the change log entries of one shard recorded after change_id `since`, oldest first
+    (between 1 and MAX_FEED_LIMIT).
+    """
+    return db.query(models.ChangeLog).filter(
+        models.ChangeLog.change_id > since
+    ).order_by(models.ChangeLog.change_id).limit(_feed_limit(limit)).all()
+
+
+def merge_feeds(feeds: Dict[str, List[models.ChangeLog]], positions: Dict[Optional[str], int], limit: int = 100) -> List[Dict]:
+    """
+    Merges the feeds of several shards (each from fetch_changes) by commit time and keeps the first `limit`.
+    Each shard's entries stay in change_id order. Every entry carries its shard and the cursor
+    that resumes the feed right after it.
+    """
+    current = {shard: cursor_position(positions, shard) for shard in feeds}
+    merged = heapq.merge(
+        *[[(shard, entry) for entry in entries] for shard, entries in sorted(feeds.items())],
+        key=lambda item: item[1].changed_at
+    )
+
+    entries = []
+    for shard, entry in itertools.islice(merged, _feed_limit(limit)):
+        current[shard] = entry.change_id
+        row = {field: getattr(entry, field) for field in FEED_FIELDS}
+        row["shard"] = shard
+        row["cursor"] = format_cursor(current)
+        entries.append(row)
+    return entries
+
+
+async def wait_for_changes(positions: Dict[Optional[str], int], timeout: float) -> bool:
+    """
+    Waits (without holding a worker thread) until a change past the cursor `positions`
+    (see parse_cursor) is committed on any shard in this process, or the timeout expires.
+
+    Returns:
+        True if new changes are available, False on timeout.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = time.monotonic() + min(timeout, MAX_POLL_TIMEOUT)
+
+    while True:
+        waiter = (loop, asyncio.Event())
+        with _waiters_lock:
+            if any(latest > cursor_position(positions, shard) for shard, latest in _latest_change_ids.items()):
+                return True
+            _waiters.add(waiter)
+        try:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(waiter[1].wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        finally:
+            with _waiters_lock:
+                _waiters.discard(waiter)
+
+
+# --- Overhead Measurement ---
+if __name__ == "__main__":
+    # Measures the per-write cost of change logging on a private in-memory database,
+    # mirroring create_result (one insert + commit per request).
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from datetime import date
+
+    bench_engine = create_engine("sqlite:///:memory:")
+    models.Base.metadata.create_all(bind=bench_engine)
+    BenchSession = sessionmaker(autocommit=False, autoflush=False, bind=bench_engine)
+
+    db = BenchSession()
+    db.add(models.Student(student_id=1, first_name="Bench", last_name="Mark", email="bench@uni.edu", enrollment_year=2023, level=100))
+    db.add(models.Semester(semester_id=1, semester_name="Bench", start_date=date(2023, 1, 1), end_date=date(2023, 5, 1)))
+    db.add(models.Course(course_id=1, course_code="BEN101", course_name="Bench", credits=3, semester_offered=1, department="CS"))
+    db.commit()
+    db.close()
+
+    def time_writes(n: int) -> float:
+        db = BenchSession()
+        start = time.perf_counter()
+        for _ in range(n):
+            db.add(models.Result(student_id=1, course_id=1, semester_id=1, grade='A', grade_point=4.0, credits=3))
+            db.commit()
+        elapsed = time.perf_counter() - start
+        db.close()
+        return elapsed / n * 1e6
+
+    # Alternate both modes and keep the best round of each, to filter out machine noise
+    n = 1000
+    untracked, tracked = [], []
+    for _ in range(5):
+        untracked.append(time_writes(n))
+        track_changes(BenchSession)
+        tracked.append(time_writes(n))
+        untrack_changes(BenchSession)
+    untracked, tracked = min(untracked), min(tracked)
+
+    print("--- Change Log Overhead ---")
+    print(f"Without change log: {untracked:.1f} us/write")
+    print(f"With change log:    {tracked:.1f} us/write")
+    print(f"Overhead:           {tracked - untracked:.1f} us/write ({(tracked / untracked - 1) * 100:.0f}%)")
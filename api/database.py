@@ -1,3 +1,4 @@
+import os
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -7,12 +8,14 @@ from sqlalchemy.orm import sessionmaker
 # For this MVP and academic defense, SQLite is sufficient and requires no external setup.
 # Database URL for SQLite.
 # Using in-memory database for Vercel ensuring no file-permission errors.
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# DATABASE_URL overrides it, e.g. "sqlite:///./academy.db" (required for sharding, see sharding.py).
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///:memory:")
 
 # Create the database engine.
 # connect_args={"check_same_thread": False} is needed only for SQLite.
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
 )
 
 # Create a SessionLocal class. Each instance of this class will be a database session.
@@ -0,0 +1,245 @@
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.orm import Session, joinedload
+from typing import Dict, Iterable, List, Optional, Set
+import threading
+import models, changes
+
+# Built-in 4-point scale, used when no GradingScale rows exist.
+# Matches the original rule: every grade except 'F' is a pass.
+DEFAULT_BANDS = {"A": 4.0, "B": 3.0, "C": 2.0, "D": 1.0, "F": 0.0}
+DEFAULT_PASS_GRADE_POINT = 1.0
+
+
+class GradeTable:
+    """
+    Precomputed lookups for one grading scale.
+    Converting a grade or checking a pass is a single dict/set lookup, so bulk ingest and
+    GPA recomputation never go back to the database for scale rules.
+    """
+
+    def __init__(self, bands: Dict[str, float], pass_grade_point: float, best_attempt_only: bool = False):
+        self.points = {grade.upper(): float(point) for grade, point in bands.items()}
+        self.passing = frozenset(grade for grade, point in self.points.items() if point >= pass_grade_point)
+        self.pass_grade_point = float(pass_grade_point)
+        self.best_attempt_only = best_attempt_only
+
+    def grade_point(self, grade: str) -> float:
+        point = self.points.get(grade.upper())
+        if point is None:
+            raise ValueError(f"Unknown grade '{grade}'. Valid grades: {', '.join(self.points)}")
+        return point
+
+    def is_pass(self, grade: str) -> bool:
+        return grade.upper() in self.passing
+
+
+# Cache of department -> GradeTable (key None holds the default scale).
+# Filled on first use and dropped whenever a scale or band is written.
+# The dict is never modified in place: readers take a reference, writers swap in a new dict.
+# _generation is bumped on every invalidation, so a load that started before it is not cached.
+_tables: Dict[Optional[str], GradeTable] = {}
+_generation = 0
+_tables_lock = threading.Lock()
+
+
+def invalidate_tables(committed_changes=None) -> None:
+    """
+    Drops the cached lookup tables. Registered as a change log subscriber below.
+    """
+    global _tables, _generation
+    with _tables_lock:
+        _generation += 1
+        _tables = {}
+
+
+changes.subscribe(invalidate_tables, {"grading_scales", "grade_bands"})
+
+
+def _load_tables(db: Session) -> Dict[Optional[str], GradeTable]:
+    """
+    Loads every grading scale in one query and precomputes its lookup table.
+    The result is cached unless a scale was written while loading.
+    """
+    global _tables
+    generation = _generation
+
+    scales = db.query(models.GradingScale).options(joinedload(models.GradingScale.bands)).all()
+
+    tables = {None: GradeTable(DEFAULT_BANDS, DEFAULT_PASS_GRADE_POINT)}
+    for scale in scales:
+        tables[scale.department] = GradeTable(
+            {band.grade: band.grade_point for band in scale.bands},
+            scale.pass_grade_point,
+            bool(scale.best_attempt_only)
+        )
+
+    with _tables_lock:
+        if generation == _generation:
+            _tables = tables
+    return tables
+
+
+def get_table(department: Optional[str], db: Session) -> GradeTable:
+    """
+    Returns the lookup table of a department, falling back to the default scale.
+    """
+    tables = _tables
+    if not tables:
+        tables = _load_tables(db)
+    return tables.get(department) or tables[None]
+
+
+def grade_results(rows: List[Dict], db: Session) -> List[Dict]:
+    """
+    Bulk ingest step: derives grade_point for a batch of result rows from the scale of
+    each course's department. Any grade_point supplied by the caller is ignored.
+    Course departments are fetched in a single query for the whole batch.
+
+    Raises:
+        ValueError if a course does not exist or a grade is not on its department's scale.
+    """
+    course_ids = {row["course_id"] for row in rows}
+    departments = dict(
+        db.query(models.Course.course_id, models.Course.department)
+        .filter(models.Course.course_id.in_(course_ids)).all()
+    )
+
+    graded = []
+    for row in rows:
+        if row["course_id"] not in departments:
+            raise ValueError(f"Course {row['course_id']} not found.")
+        table = get_table(departments[row["course_id"]], db)
+        grade = row["grade"].upper()
+        graded.append({**row, "grade": grade, "grade_point": table.grade_point(grade)})
+
+    return graded
+
+
+def attempts_query(db: Session):
+    """
+    Base query for GPA work: one row per result, with the course department needed to pick the scale.
+    """
+    return db.query(
+        models.Result.result_id,
+        models.Result.student_id,
+        models.Result.course_id,
+        models.Result.grade,
+        models.Result.grade_point,
+        models.Result.credits,
+        models.Course.department
+    ).join(models.Course, models.Course.course_id == models.Result.course_id)
+
+
+def passed_course_ids(student_id: int, db: Session) -> Set[int]:
+    """
+    Returns the ids of all courses the student has passed under their department's pass rule.
+    """
+    attempts = attempts_query(db).filter(models.Result.student_id == student_id).all()
+    return {a.course_id for a in attempts if get_table(a.department, db).is_pass(a.grade)}
+
+
+def select_counted_attempts(attempts: Iterable, db: Session) -> List:
+    """
+    Applies the retake rule: for courses whose department scale counts only the best attempt,
+    keeps the attempt with the highest grade point. Other attempts are all counted.
+    `attempts` are rows from attempts_query() (for one student).
+    """
+    counted = []
+    best = {}
+
+    for attempt in attempts:
+        if not get_table(attempt.department, db).best_attempt_only:
+            counted.append(attempt)
+            continue
+        current = best.get(attempt.course_id)
+        if current is None or attempt.grade_point > current.grade_point:
+            best[attempt.course_id] = attempt
+
+    return counted + list(best.values())
+
+
+def set_scale(department: str, bands: Dict[str, float], pass_grade_point: float,
+              best_attempt_only: bool, db: Session) -> models.GradingScale:
+    """
+    Creates or replaces the grading scale of a department.
+    Stored results are not touched; call logic.recompute_department_cgpas afterwards.
+    """
+    scale = db.query(models.GradingScale).filter(models.GradingScale.department == department).first()
+    if scale is None:
+        scale = models.GradingScale(department=department)
+        db.add(scale)
+
+    scale.pass_grade_point = pass_grade_point
+    scale.best_attempt_only = best_attempt_only
+    # Delete the old bands before inserting the new ones, so (scale_id, grade) stays unique
+    scale.bands = []
+    db.flush()
+    scale.bands = [models.GradeBand(grade=grade.upper(), grade_point=point) for grade, point in bands.items()]
+
+    db.commit()
+    db.refresh(scale)
+    invalidate_tables()
+    return scale
+
+
+def grades_in_use(department: str, db: Session) -> Dict[str, int]:
+    """
+    Returns how many results of the department's courses carry each grade.
+    Used to refuse a scale that would drop grades still on record.
+    """
+    grade = func.upper(models.Result.grade)
+    rows = db.query(grade, func.count()).join(
+        models.Course, models.Course.course_id == models.Result.course_id
+    ).filter(models.Course.department == department).group_by(grade).all()
+    return dict(rows)
+
+
+def regrade_department(department: str, db: Session, table: Optional[GradeTable] = None) -> int:
+    """
+    Re-derives the stored grade_point of every result in a department from its current scale
+    (or from `table`, e.g. a scale that is not stored yet). Nothing is committed.
+    Only rows whose point changed are written, in a single executemany UPDATE.
+
+    Raises:
+        ValueError if a result has a grade that is not on the scale (nothing is written then).
+
+    Returns:
+        Number of results updated.
+    """
+    table = table or get_table(department, db)
+    attempts = attempts_query(db).filter(models.Course.department == department).all()
+
+    unknown = sorted({a.grade.upper() for a in attempts if a.grade.upper() not in table.points})
+    if unknown:
+        raise ValueError(f"Results with grades not on the {department} scale: {', '.join(unknown)}")
+
+    updates = []
+    for attempt in attempts:
+        point = table.points[attempt.grade.upper()]
+        if float(attempt.grade_point) != point:
+            updates.append({"rid": attempt.result_id, "point": point})
+
+    if updates:
+        results = models.Result.__table__
+        db.execute(
+            update(results).where(results.c.result_id == bindparam("rid")).values(grade_point=bindparam("point")),
+            updates
+        )
+        # Core UPDATE bypasses the session hooks, so log the changes explicitly
+        changes.record_changes(db, [("results", u["rid"], "update") for u in updates])
+        db.expire_all()
+
+    return len(updates)
+
+
+# --- Usage Examples (for demonstration/testing) ---
+if __name__ == "__main__":
+    print("--- Grading Scale Demonstration ---")
+
+    # A stricter scale where 'D' no longer passes and only the best retake counts
+    strict = GradeTable({"A": 4.0, "B": 3.0, "C": 2.0, "D": 1.0, "F": 0.0}, pass_grade_point=2.0, best_attempt_only=True)
+    default = GradeTable(DEFAULT_BANDS, DEFAULT_PASS_GRADE_POINT)
+
+    for grade in ["A", "C", "D", "F"]:
+        print(f"Grade {grade}: {strict.grade_point(grade)} points, "
+              f"passes default scale: {default.is_pass(grade)}, passes strict scale: {strict.is_pass(grade)}")
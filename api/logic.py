@@ -1,6 +1,6 @@
 from sqlalchemy.orm import Session
 from typing import List, Dict, Tuple
-import models
+import models, grading, blocking
 
 def calculate_gpa_metrics(results: List[models.Result]) -> Dict:
     """
@@ -44,12 +44,15 @@ def calculate_student_cgpa(student_id: int, db: Session) -> Dict:
         Dict containing 'cgpa', 'total_credits_earned', and 'total_grade_points'.
     """
     # 1. Fetch all results for the student
-    all_results = db.query(models.Result).filter(models.Result.student_id == student_id).all()
+    all_results = grading.attempts_query(db).filter(models.Result.student_id == student_id).all()
 
-    # 2. Calculate metrics using the helper function
-    metrics = calculate_gpa_metrics(all_results)
+    # 2. Apply the retake rule of each course's grading scale (best attempt only, if configured)
+    counted_results = grading.select_counted_attempts(all_results, db)
 
-    # 3. Return the cumulative data
+    # 3. Calculate metrics using the helper function
+    metrics = calculate_gpa_metrics(counted_results)
+
+    # 4. Return the cumulative data
     return {
         "student_id": student_id,
         "cgpa": metrics["gpa"],
@@ -83,19 +86,14 @@ def check_course_eligibility(student_id: int, course_id: int, db: Session) -> Tu
 
     missing_prereqs = []
 
+    # Courses the student has passed, judged by each course department's pass rule
+    passed_ids = grading.passed_course_ids(student_id, db)
+
     for entry in prereq_entries:
         prereq_course_id = entry.prerequisite_course_id
         
         # 3. Check if student has a passing grade for this prerequisite
-        # We look for a result for this student and this prerequisite course
-        # Assuming 'F' is the failing grade. Adjust logic if 'D' is also fail.
-        passed_prereq = db.query(models.Result).filter(
-            models.Result.student_id == student_id,
-            models.Result.course_id == prereq_course_id,
-            models.Result.grade != 'F' # Rule: Must not be F
-        ).first()
-
-        if not passed_prereq:
+        if prereq_course_id not in passed_ids:
             # Get the name of the missing course for the message
             prereq_course = db.query(models.Course).filter(models.Course.course_id == prereq_course_id).first()
             course_name = prereq_course.course_code if prereq_course else f"ID {prereq_course_id}"
@@ -107,6 +105,38 @@ def check_course_eligibility(student_id: int, course_id: int, db: Session) -> Tu
     
     return True, "Eligible."
 
+def recompute_department_cgpas(department: str, db: Session) -> Dict[int, float]:
+    """
+    Brings a department in line with its (changed) grading scale:
+    1. Re-derives stored grade points of the department's results.
+    2. Recomputes the CGPA of every student with a result in the department.
+
+    All affected students' results are fetched in one query and grouped in memory.
+
+    Returns:
+        Dict mapping student_id to the new CGPA.
+    """
+    # 1. Update stored grade points and the blocked-prerequisite index (pass rules may have changed)
+    grading.regrade_department(department, db)
+    blocking.rebuild_index(db, department)
+    db.commit()
+
+    # 2. Fetch every result of every affected student (CGPA spans all departments)
+    affected = db.query(models.Result.student_id).join(models.Course).filter(
+        models.Course.department == department
+    ).distinct()
+    attempts = grading.attempts_query(db).filter(models.Result.student_id.in_(affected)).all()
+
+    by_student = {}
+    for attempt in attempts:
+        by_student.setdefault(attempt.student_id, []).append(attempt)
+
+    # 3. Recalculate each student's CGPA with the same rules as calculate_student_cgpa
+    return {
+        student_id: calculate_gpa_metrics(grading.select_counted_attempts(student_attempts, db))["gpa"]
+        for student_id, student_attempts in by_student.items()
+    }
+
 # --- Usage Examples (for demonstration/testing) ---
 if __name__ == "__main__":
     # This block is for manual testing and explanation purposes.
@@ -138,5 +168,5 @@ if __name__ == "__main__":
     print("To check eligibility for 'Advanced Java':")
     print("1. System looks up prerequisites for 'Advanced Java' -> finds 'Intro to Java'.")
     print("2. System queries Student's results for 'Intro to Java'.")
-    print("3. If result exists AND grade != 'F', returns True.")
+    print("3. If a result exists whose grade passes the department's grading scale, returns True.")
     print("4. Otherwise, returns False with message 'Missing: Intro to Java'.")
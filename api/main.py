@@ -1,16 +1,24 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 
-import models, schemas, logic, ai_advisor
+import models, schemas, logic, ai_advisor, changes, grading, sharding, blocking, serialization
 import seed
 from database import SessionLocal, engine
 
 # Create the database tables automatically on startup
 models.Base.metadata.create_all(bind=engine)
 
+# Record every write in the change log (same transaction as the write itself)
+changes.track_changes(SessionLocal)
+
+# Keep the blocked-prerequisite index up to date on every write
+blocking.track_blocking(SessionLocal)
+
 app = FastAPI(title="Academic Advisory System API", root_path="/api")
 
 @app.on_event("startup")
@@ -20,6 +28,16 @@ def startup_event():
     except Exception as e:
         print(f"Error seeding data: {e}")
 
+    # Build the blocked-prerequisite index for data written before it existed (no alerts for old results)
+    def rebuild(db):
+        blocking.rebuild_index(db, alert=False)
+        db.commit()
+
+    try:
+        sharding.router.run_all(rebuild)
+    except Exception as e:
+        print(f"Error building blocked-prerequisite index: {e}")
+
 # Allow CORS for all origins (for MVP simplicity)
 app.add_middleware(
     CORSMiddleware,
@@ -37,29 +55,70 @@ def get_db():
     finally:
         db.close()
 
+# Dependency for student-scoped endpoints: a session on the shard holding the student
+# (the main database when sharding is disabled)
+def get_student_db(student_id: int):
+    db = sharding.router.session_for_student(student_id)
+    try:
+        yield db
+    finally:
+        db.close()
+
 # --- Student Endpoints (Admin) ---
 
 @app.post("/students/", response_model=schemas.StudentResponse)
-def create_student(student: schemas.StudentCreate, db: Session = Depends(get_db)):
+def create_student(student: schemas.StudentCreate):
     """
-    Admin: Create a new student record.
+    Admin: Create a new student record (in the shard of the student's department).
+    Emails are unique across all shards.
     """
+    try:
+        student_id = sharding.router.allocate_student_id(student.department, student.email)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     db_student = models.Student(**student.dict())
-    db.add(db_student)
-    db.commit()
-    db.refresh(db_student)
+    if student_id is not None:
+        db_student.student_id = student_id
+
+    with sharding.router.session_for_department(student.department) as db:
+        db.add(db_student)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            sharding.router.release_student_id(student_id)
+            if db.query(models.Student).filter(models.Student.email == student.email).first():
+                raise HTTPException(status_code=400, detail=f"A student with email '{student.email}' already exists.")
+            # The shard already holds this id: the directory is out of sync with the shard
+            raise HTTPException(status_code=409, detail=f"Student id {student_id} is already in use on its shard.")
+        except Exception:
+            # Do not leave a directory entry pointing at a student that was never written
+            db.rollback()
+            sharding.router.release_student_id(student_id)
+            raise
+        db.refresh(db_student)
     return db_student
 
 @app.get("/students/", response_model=List[schemas.StudentResponse])
-def read_students(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_students(skip: int = 0, limit: int = 100, fast: bool = False):
     """
-    Admin/Adviser: List all students.
+    Admin/Adviser: List all students (across all shards).
+    fast=true skips ORM loading and response validation (see serialization.py).
     """
-    students = db.query(models.Student).offset(skip).limit(limit).all()
-    return students
+    if fast:
+        rows = sharding.router.query_all(lambda db: serialization.student_rows(db, limit=skip + limit))
+        rows.sort(key=lambda row: row["student_id"])
+        return serialization.FastJSONResponse(rows[skip:skip + limit])
+
+    students = sharding.router.query_all(
+        lambda db: db.query(models.Student).order_by(models.Student.student_id).limit(skip + limit).all()
+    )
+    students.sort(key=lambda student: student.student_id)
+    return students[skip:skip + limit]
 
 @app.get("/students/{student_id}", response_model=schemas.StudentResponse)
-def read_student(student_id: int, db: Session = Depends(get_db)):
+def read_student(student_id: int, db: Session = Depends(get_student_db)):
     """
     Read a specific student by ID.
     """
@@ -79,6 +138,7 @@ def create_course(course: schemas.CourseCreate, db: Session = Depends(get_db)):
     db.add(db_course)
     db.commit()
     db.refresh(db_course)
+    sharding.router.sync_catalog(models.Course, ids=[db_course.course_id])
     return db_course
 
 @app.get("/courses/", response_model=List[schemas.CourseResponse])
@@ -92,37 +152,264 @@ def read_courses(skip: int = 0, limit: int = 100, db: Session = Depends(get_db))
 # --- Result Endpoints (Student & Adviser) ---
 
 @app.post("/results/", response_model=schemas.ResultResponse)
-def create_result(result: schemas.ResultCreate, db: Session = Depends(get_db)):
+def create_result(result: schemas.ResultCreate):
     """
     Admin: Record a result for a student (e.g., after semester exams).
+    The grade point is derived from the grade using the course department's grading scale.
     """
-    db_result = models.Result(**result.dict())
-    db.add(db_result)
-    db.commit()
-    db.refresh(db_result)
+    with sharding.router.session_for_student(result.student_id) as db:
+        try:
+            row = grading.grade_results([result.dict()], db)[0]
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        db_result = models.Result(**row)
+        result_ids = sharding.router.allocate_result_ids(1)
+        if result_ids is not None:
+            db_result.result_id = result_ids[0]
+        db.add(db_result)
+        db.commit()
+        db.refresh(db_result)
+        # Load the nested objects of the response before the session closes
+        db_result.course, db_result.semester
     return db_result
 
+@app.post("/results/bulk", response_model=List[schemas.ResultResponse])
+def create_results_bulk(results: List[schemas.ResultCreate]):
+    """
+    Admin: Record a batch of results (e.g., a whole course's exam sheet).
+    Grade points for the whole batch are derived in one pass from the precomputed scale tables.
+    Every row is graded and written on its shard before any shard commits, so an invalid row
+    rejects the whole batch.
+    """
+    # Group the batch by the shard holding each student
+    by_shard = {}
+    shard_of_student = {}
+    for result in results:
+        if result.student_id not in shard_of_student:
+            shard_of_student[result.student_id] = sharding.router.shard_for_student(result.student_id)
+        by_shard.setdefault(shard_of_student[result.student_id], []).append(result.dict())
+
+    sessions = {}
+    try:
+        # 1. Grade every row first
+        graded = {}
+        for shard, rows in by_shard.items():
+            sessions[shard] = sharding.router.session_for_shard(shard)
+            try:
+                graded[shard] = grading.grade_results(rows, sessions[shard])
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        # 2. Write the rows of every shard (with globally unique ids when sharded)
+        result_ids = sharding.router.allocate_result_ids(len(results))
+        next_ids = iter(result_ids or [])
+        db_results = []
+        for shard, rows in graded.items():
+            shard_results = [models.Result(**row) for row in rows]
+            if result_ids is not None:
+                for db_result in shard_results:
+                    db_result.result_id = next(next_ids)
+            sessions[shard].add_all(shard_results)
+            sessions[shard].flush()
+            db_results.extend(shard_results)
+
+        # 3. Commit only once every shard accepted its rows
+        for db in sessions.values():
+            db.commit()
+
+        # Load the response fields (and nested objects) before the sessions close
+        for db_result in db_results:
+            db_result.result_id, db_result.course, db_result.semester
+        return db_results
+    finally:
+        # Closing rolls back any shard that did not commit
+        for db in sessions.values():
+            db.close()
+
 @app.get("/results/student/{student_id}", response_model=List[schemas.ResultResponse])
-def read_student_results(student_id: int, db: Session = Depends(get_db)):
+def read_student_results(student_id: int, fast: bool = False, db: Session = Depends(get_student_db)):
     """
     Student: View their own academic results.
     Adviser: View a specific student's results.
+    fast=true skips ORM loading and response validation (see serialization.py).
     """
+    if fast:
+        return serialization.FastJSONResponse(serialization.result_rows(db, student_id=student_id))
+
     results = db.query(models.Result).filter(models.Result.student_id == student_id).all()
     return results
 
 @app.get("/results/", response_model=List[schemas.ResultResponse])
-def read_all_results(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_all_results(skip: int = 0, limit: int = 100, fast: bool = False):
     """
-    Adviser/Admin: View all results across the department.
+    Adviser/Admin: View all results across the department (and across all shards).
+    fast=true skips ORM loading and response validation (see serialization.py).
     """
-    results = db.query(models.Result).offset(skip).limit(limit).all()
-    return results
+    if fast:
+        rows = sharding.router.query_all(lambda db: serialization.result_rows(db, limit=skip + limit))
+        rows.sort(key=lambda row: (row["student_id"], row["result_id"]))
+        return serialization.FastJSONResponse(rows[skip:skip + limit])
+
+    results = sharding.router.query_all(
+        lambda db: db.query(models.Result)
+        .options(joinedload(models.Result.course), joinedload(models.Result.semester))
+        .order_by(models.Result.student_id, models.Result.result_id)
+        .limit(skip + limit).all()
+    )
+    results.sort(key=lambda result: (result.student_id, result.result_id))
+    return results[skip:skip + limit]
+
+# --- At-Risk Endpoints (Adviser) ---
+
+@app.get("/blocked-by/{course_id}", response_model=schemas.BlockedByResponse)
+def read_blocked_by(course_id: int, blocked_course_id: Optional[int] = None, status: Optional[str] = None,
+                    db: Session = Depends(get_db)):
+    """
+    Adviser: Which students are blocked because they failed (or have not taken) a prerequisite?
+    e.g. /blocked-by/{CSC101 id}?blocked_course_id={CSC301 id}&status=failed
+    Answered from the blocked-prerequisite index, so the cost grows with the number of affected students.
+    """
+    if status is not None and status not in ("failed", "missing"):
+        raise HTTPException(status_code=400, detail="status must be 'failed' or 'missing'")
+
+    # Courses are catalog rows, so main has every one of them
+    for requested_id in (course_id, blocked_course_id):
+        if requested_id is not None and db.query(models.Course).filter(models.Course.course_id == requested_id).first() is None:
+            raise HTTPException(status_code=404, detail=f"Course {requested_id} not found")
+
+    downstream = blocking.downstream_course_ids(course_id, db)
+
+    students = []
+    if blocked_course_id is None or blocked_course_id in downstream:
+        students = sharding.router.query_all(lambda shard_db: blocking.blocked_students(course_id, shard_db, status))
+        students.sort(key=lambda row: row.student_id)
+
+    return {
+        "prerequisite_course_id": course_id,
+        "blocked_course_ids": sorted(downstream),
+        "students": students
+    }
+
+# --- Grading Scale Endpoints (Admin) ---
+
+@app.get("/grading-scales/", response_model=List[schemas.GradingScaleResponse])
+def read_grading_scales(db: Session = Depends(get_db)):
+    """
+    List all configured grading scales. The scale without a department is the default.
+    """
+    return db.query(models.GradingScale).all()
+
+@app.put("/grading-scales/{department}")
+def update_grading_scale(department: str, scale: schemas.GradingScaleCreate, db: Session = Depends(get_db)):
+    """
+    Admin: Create or replace a department's grading scale.
+    Stored grade points and the CGPAs of every affected student are recomputed immediately (on every shard).
+    A scale that drops a grade still used by the department's results is rejected, and nothing is changed.
+    """
+    if not scale.bands:
+        raise HTTPException(status_code=400, detail="A grading scale needs at least one grade.")
+
+    grades = [band.grade.upper() for band in scale.bands]
+    duplicates = sorted({grade for grade in grades if grades.count(grade) > 1})
+    if duplicates:
+        raise HTTPException(status_code=400, detail=f"Duplicate grades: {', '.join(duplicates)}")
+
+    # Grades on record (across all shards) that the new scale would no longer define
+    dropped = {}
+    for grade, count in sharding.router.query_all(lambda shard_db: list(grading.grades_in_use(department, shard_db).items())):
+        if grade not in grades:
+            dropped[grade] = dropped.get(grade, 0) + count
+    if dropped:
+        raise HTTPException(status_code=409, detail={
+            "message": "The new scale drops grades that existing results still use.",
+            "results_by_grade": dropped
+        })
+
+    bands = {band.grade: band.grade_point for band in scale.bands}
+
+    # 1. Regrade every shard with the new scale before anything is committed.
+    #    A result with a dropped grade recorded after the check above then aborts the whole change.
+    sessions = {
+        shard: db if shard == sharding.MAIN_SHARD else sharding.router.session_for_shard(shard)
+        for shard in sharding.router.shards()
+    }
+    try:
+        table = grading.GradeTable(bands, scale.pass_grade_point, scale.best_attempt_only)
+        try:
+            for shard_db in sessions.values():
+                grading.regrade_department(department, shard_db, table)
+        except ValueError as e:
+            for shard_db in sessions.values():
+                shard_db.rollback()
+            raise HTTPException(status_code=409, detail=str(e))
+
+        # 2. Store the scale (main's regrade commits with it), then the other shards' regrades
+        db_scale = grading.set_scale(department, bands, scale.pass_grade_point, scale.best_attempt_only, db)
+        for shard_db in sessions.values():
+            if shard_db is not db:
+                shard_db.commit()
+    finally:
+        for shard_db in sessions.values():
+            if shard_db is not db:
+                shard_db.close()
+    sharding.router.sync_catalog(models.GradingScale, models.GradeBand)
+
+    # 3. CGPAs and the blocked-prerequisite index under the new scale
+    cgpas = {}
+    incomplete_shards = {}
+    for shard in sharding.router.shards():
+        with sharding.router.session_for_shard(shard) as shard_db:
+            try:
+                cgpas.update(logic.recompute_department_cgpas(department, shard_db))
+            except ValueError as e:
+                # A result with a dropped grade was recorded while the scale was being applied.
+                # The scale is live; report the shards whose results still need fixing.
+                incomplete_shards[shard] = str(e)
+
+    return {
+        "scale": schemas.GradingScaleResponse.from_orm(db_scale),
+        "students_recomputed": len(cgpas),
+        "cgpas": cgpas,
+        "incomplete_shards": incomplete_shards
+    }
+
+# --- Change Feed Endpoint (Cache Invalidation) ---
+
+def fetch_change_feed(positions: Dict, limit: int) -> List[Dict]:
+    # Each shard has its own change log; read them all and merge by commit time
+    feeds = {}
+    for shard in sharding.router.shards():
+        with sharding.router.session_for_shard(shard) as db:
+            feeds[shard] = changes.fetch_changes(db, changes.cursor_position(positions, shard), limit)
+    return changes.merge_feeds(feeds, positions, limit)
+
+@app.get("/changes", response_model=List[schemas.ChangeResponse])
+async def read_changes(since: str = "0", limit: int = Query(100, ge=1, le=changes.MAX_FEED_LIMIT), timeout: float = 25.0):
+    """
+    Change Feed (long-poll):
+    Returns the change log entries after the cursor `since` (at most 1000 per call), from every shard.
+    If there are none yet, waits up to `timeout` seconds for a new commit before returning an empty list.
+    Clients pass the `cursor` of the last entry they received as the next `since`
+    (a cursor holds a change_id per shard, e.g. "main:12,cs:3"; a plain change_id applies to every shard).
+
+    The endpoint is async: waiting pollers do not occupy the threadpool that serves the other
+    endpoints; only the short database reads run in it.
+    """
+    try:
+        positions = changes.parse_cursor(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor '{since}'. Expected e.g. '12' or 'main:12,cs:3'.")
+
+    entries = await run_in_threadpool(fetch_change_feed, positions, limit)
+    if not entries and timeout > 0 and await changes.wait_for_changes(positions, timeout):
+        entries = await run_in_threadpool(fetch_change_feed, positions, limit)
+    return entries
 
 # --- Advanced Logic Endpoints (Dashboard & Advisory) ---
 
 @app.get("/dashboard/student/{student_id}")
-def get_student_dashboard(student_id: int, db: Session = Depends(get_db)):
+def get_student_dashboard(student_id: int, db: Session = Depends(get_student_db)):
     """
     Student Dashboard API:
     Returns the core metrics needed for the student's home screen:
@@ -156,7 +443,7 @@ def get_student_dashboard(student_id: int, db: Session = Depends(get_db)):
     }
 
 @app.get("/adviser/student/{student_id}")
-def get_adviser_view(student_id: int, db: Session = Depends(get_db)):
+def get_adviser_view(student_id: int, db: Session = Depends(get_student_db)):
     """
     Adviser View API:
     Provides the adviser with a deep dive into a specific student's performance.
@@ -171,7 +458,7 @@ class QuestionRequest(BaseModel):
     question: str
 
 @app.post("/ask/{student_id}")
-def ask_advisor_endpoint(student_id: int, request: QuestionRequest, db: Session = Depends(get_db)):
+def ask_advisor_endpoint(student_id: int, request: QuestionRequest, db: Session = Depends(get_student_db)):
     """
     AI Advisor Chat Endpoint:
     Accepts a student's question and returns a context-aware response.
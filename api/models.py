@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, DECIMAL
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, ForeignKey, DECIMAL, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -14,10 +14,14 @@ class Student(Base):
     email = Column(String, unique=True, nullable=False)
     enrollment_year = Column(Integer, nullable=False)
     level = Column(Integer, nullable=False) # e.g., 100, 200
+    department = Column(String, nullable=True) # Home department; also the shard key (see sharding.py)
 
     # Relationship to Results: One student has many results
     results = relationship("Result", back_populates="student")
 
+    # Department as index prefix: per-department listings stay index range scans
+    __table_args__ = (Index("ix_students_department", "department", "student_id"),)
+
 
 class Course(Base):
     """
@@ -34,6 +38,8 @@ class Course(Base):
 
     # Relationship to Results: One course appears in many results
     results = relationship("Result", back_populates="course")
+
+    __table_args__ = (Index("ix_courses_department", "department", "course_code"),)
     
     # Relationships for Prerequisites
     # We will define the Prerequisite table explicitly below
@@ -90,3 +96,93 @@ class Prerequisite(Base):
     # We use 'foreign_keys' to specify which column the relationship refers to
     course = relationship("Course", foreign_keys=[course_id])
     prerequisite_course = relationship("Course", foreign_keys=[prerequisite_course_id])
+
+
+class GradingScale(Base):
+    """
+    Grading scale of a department: how letter grades map to grade points and which grades pass.
+    The scale with department = NULL is the university-wide default.
+    """
+    __tablename__ = "grading_scales"
+
+    scale_id = Column(Integer, primary_key=True, index=True)
+    department = Column(String, unique=True, nullable=True) # NULL for the default scale
+    pass_grade_point = Column(DECIMAL(3, 2), nullable=False) # Minimum grade point that counts as a pass
+    best_attempt_only = Column(Boolean, nullable=False, default=False) # Retakes: only the best attempt counts
+
+    # Relationship to GradeBands: One scale has many bands
+    bands = relationship("GradeBand", back_populates="scale", cascade="all, delete-orphan")
+
+
+class GradeBand(Base):
+    """
+    One letter grade of a grading scale and the grade point it is worth.
+    """
+    __tablename__ = "grade_bands"
+
+    band_id = Column(Integer, primary_key=True, index=True)
+    scale_id = Column(Integer, ForeignKey("grading_scales.scale_id"), nullable=False)
+    grade = Column(String, nullable=False) # e.g., 'A'
+    grade_point = Column(DECIMAL(3, 2), nullable=False) # e.g., 4.00
+
+    scale = relationship("GradingScale", back_populates="bands")
+
+    __table_args__ = (UniqueConstraint("scale_id", "grade", name="uq_grade_bands_scale_grade"),)
+
+
+class BlockedPrerequisite(Base):
+    """
+    Reverse index of blocked prerequisites: one row per student and prerequisite course
+    the student has failed or not taken yet. Maintained by blocking.py on every result write,
+    so "who is blocked by CSC101?" is an index lookup instead of an eligibility check per student.
+    """
+    __tablename__ = "blocked_prerequisites"
+
+    student_id = Column(Integer, ForeignKey("students.student_id"), primary_key=True)
+    prerequisite_course_id = Column(Integer, ForeignKey("courses.course_id"), primary_key=True)
+    status = Column(String, nullable=False) # 'failed' or 'missing'
+
+    __table_args__ = (Index("ix_blocked_prerequisites_course", "prerequisite_course_id", "status"),)
+
+
+class StudentDirectory(Base):
+    """
+    Maps every student to their home department, and so to their shard (see sharding.py).
+    Lives only in the main database, which also allocates globally unique student ids
+    and keeps emails unique across shards.
+    """
+    __tablename__ = "student_directory"
+
+    student_id = Column(Integer, primary_key=True, index=True)
+    department = Column(String, nullable=True)
+    email = Column(String, unique=True, nullable=False)
+
+
+class IdSequence(Base):
+    """
+    Next free id of a table whose rows are spread over several shards (e.g. results).
+    Lives only in the main database.
+    """
+    __tablename__ = "id_sequences"
+
+    name = Column(String, primary_key=True)
+    next_id = Column(Integer, nullable=False)
+
+
+class ChangeLog(Base):
+    """
+    Append-only log of every write to the tables above.
+    A row is inserted in the same transaction as the mutation it describes (see changes.py),
+    so caches and workers can invalidate precisely by reading the log in change_id order.
+    """
+    __tablename__ = "change_log"
+
+    change_id = Column(Integer, primary_key=True, index=True) # Monotonic sequence number
+    entity = Column(String, nullable=False) # Table name, e.g., 'results'
+    entity_id = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False) # 1 on insert, +1 on every later change
+    operation = Column(String, nullable=False) # 'insert', 'update' or 'delete'
+    changed_at = Column(DateTime, nullable=False)
+
+    # Used to look up the latest version of an entity when recording the next change
+    __table_args__ = (Index("ix_change_log_entity", "entity", "entity_id"),)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import date
+from datetime import date, datetime
 
 # --- Student Schemas ---
 class StudentBase(BaseModel):
@@ -9,6 +9,7 @@ class StudentBase(BaseModel):
     email: str
     enrollment_year: int
     level: int
+    department: Optional[str] = None
 
 class StudentCreate(StudentBase):
     pass
@@ -61,7 +62,8 @@ class ResultBase(BaseModel):
     credits: int
 
 class ResultCreate(ResultBase):
-    pass
+    # Derived from the grade using the course department's grading scale; any supplied value is ignored
+    grade_point: Optional[float] = None
 
 class ResultResponse(ResultBase):
     result_id: int
@@ -85,3 +87,56 @@ class PrerequisiteResponse(PrerequisiteBase):
 
     class Config:
         orm_mode = True
+
+# --- Grading Scale Schemas ---
+class GradeBandBase(BaseModel):
+    grade: str
+    grade_point: float
+
+class GradeBandResponse(GradeBandBase):
+    band_id: int
+
+    class Config:
+        orm_mode = True
+
+class GradingScaleBase(BaseModel):
+    pass_grade_point: float
+    best_attempt_only: bool = False
+
+class GradingScaleCreate(GradingScaleBase):
+    bands: List[GradeBandBase]
+
+class GradingScaleResponse(GradingScaleBase):
+    scale_id: int
+    department: Optional[str] = None
+    bands: List[GradeBandResponse] = []
+
+    class Config:
+        orm_mode = True
+
+# --- Blocked Prerequisite Schemas ---
+class BlockedStudentResponse(BaseModel):
+    student_id: int
+    status: str # 'failed' or 'missing'
+
+    class Config:
+        orm_mode = True
+
+class BlockedByResponse(BaseModel):
+    prerequisite_course_id: int
+    blocked_course_ids: List[int]
+    students: List[BlockedStudentResponse]
+
+# --- Change Log Schemas ---
+class ChangeResponse(BaseModel):
+    change_id: int
+    entity: str
+    entity_id: int
+    version: int
+    operation: str
+    changed_at: datetime
+    shard: str
+    cursor: str
+
+    class Config:
+        orm_mode = True
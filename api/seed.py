@@ -1,11 +1,15 @@
 from sqlalchemy.orm import Session
 from datetime import date
-import models, database
+import models, database, changes, grading, sharding, blocking
 from database import engine
 
 # Create tables if they don't exist
 models.Base.metadata.create_all(bind=engine)
 
+# Seeded rows go through the change log and the blocked-prerequisite index like any other write
+changes.track_changes(database.SessionLocal)
+blocking.track_blocking(database.SessionLocal)
+
 def seed_data():
     db = database.SessionLocal()
     
@@ -16,9 +20,9 @@ def seed_data():
 
     print("Seeding data...")
 
-    # 1. Students
+    # 1. Students (registered in the shard directory when sharding is enabled)
     student1 = models.Student(
-        student_id=1,
+        student_id=sharding.router.allocate_student_id(None, "john@uni.edu", student_id=1),
         first_name="John",
         last_name="Doe",
         email="john@uni.edu",
@@ -31,8 +35,16 @@ def seed_data():
     sem1 = models.Semester(semester_id=1, semester_name="Year 1 Sem 1", start_date=date(2023, 1, 1), end_date=date(2023, 5, 1))
     sem2 = models.Semester(semester_id=2, semester_name="Year 1 Sem 2", start_date=date(2023, 6, 1), end_date=date(2023, 10, 1))
     db.add_all([sem1, sem2])
+
+    # 3. Default Grading Scale (4-point, 'F' fails)
+    default_scale = models.GradingScale(
+        department=None,
+        pass_grade_point=grading.DEFAULT_PASS_GRADE_POINT,
+        bands=[models.GradeBand(grade=grade, grade_point=point) for grade, point in grading.DEFAULT_BANDS.items()]
+    )
+    db.add(default_scale)
     
-    # 3. Courses
+    # 4. Courses
     # Year 1 Courses
     c_math = models.Course(course_code="MTH101", course_name="Calculus I", credits=3, semester_offered=1, department="Math")
     c_java = models.Course(course_code="CSC101", course_name="Intro to Java", credits=3, semester_offered=1, department="CS")
@@ -46,7 +58,7 @@ def seed_data():
     db.add_all([c_math, c_java, c_eng, c_ds, c_adv_java, c_capstone])
     db.commit() # Commit courses to get IDs for foreign keys
 
-    # 4. Prerequisites
+    # 5. Prerequisites
     # Data Structures needs Intro to Java
     p1 = models.Prerequisite(course_id=c_ds.course_id, prerequisite_course_id=c_java.course_id)
     # Advanced Java needs Data Structures
@@ -56,7 +68,7 @@ def seed_data():
     
     db.add_all([p1, p2, p3])
 
-    # 5. Results (John Doe's History)
+    # 6. Results (John Doe's History)
     # Passed Math and English
     r1 = models.Result(student_id=1, course_id=c_math.course_id, semester_id=1, grade='A', grade_point=4.0, credits=3)
     r2 = models.Result(student_id=1, course_id=c_eng.course_id, semester_id=1, grade='B', grade_point=3.0, credits=2)
@@ -0,0 +1,144 @@
+from fastapi.responses import Response
+from sqlalchemy import Float, cast, select
+from sqlalchemy.orm import Session
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Optional
+import json
+import models
+
+# Optional fast JSON encoder; the standard library is used when it is not installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Fast path for large list responses.
+# Rows come straight from a Core select() of the needed columns and are turned into plain dicts
+# with the same shape and field order as the response schemas (schemas.StudentResponse,
+# schemas.ResultResponse), skipping ORM object loading and Pydantic validation of trusted DB rows.
+
+STUDENT_FIELDS = ("first_name", "last_name", "email", "enrollment_year", "level", "department", "student_id")
+RESULT_FIELDS = ("student_id", "course_id", "semester_id", "grade", "grade_point", "credits", "result_id")
+COURSE_FIELDS = ("course_code", "course_name", "credits", "semester_offered", "department", "course_id")
+SEMESTER_FIELDS = ("semester_name", "start_date", "end_date", "semester_id")
+
+_students = models.Student.__table__
+_results = models.Result.__table__
+_courses = models.Course.__table__
+_semesters = models.Semester.__table__
+
+
+def _default(value):
+    # Types orjson/json cannot encode natively
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response for already-serializable content (lists of dicts), encoded with orjson.
+    Returning it from an endpoint bypasses response_model validation.
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=_default)
+        return json.dumps(content, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+def _column(table, field):
+    # Read DECIMAL columns as floats, as the response schemas do, without building Decimal objects
+    # (cast in SQL: SQLite returns whole numbers such as 4.00 as integers otherwise)
+    if field == "grade_point":
+        return cast(table.c[field], Float)
+    return table.c[field]
+
+
+def student_rows(db: Session, skip: int = 0, limit: Optional[int] = 100) -> List[Dict]:
+    stmt = select(*[_students.c[f] for f in STUDENT_FIELDS]).order_by(_students.c.student_id).offset(skip).limit(limit)
+    return [dict(zip(STUDENT_FIELDS, row)) for row in db.execute(stmt)]
+
+
+def result_rows(db: Session, student_id: Optional[int] = None, skip: int = 0, limit: Optional[int] = None) -> List[Dict]:
+    """
+    Results with their nested course and semester, ordered by (student_id, result_id).
+    """
+    stmt = select(
+        *[_column(_results, f) for f in RESULT_FIELDS],
+        *[_courses.c[f] for f in COURSE_FIELDS],
+        *[_semesters.c[f] for f in SEMESTER_FIELDS]
+    ).outerjoin(
+        _courses, _courses.c.course_id == _results.c.course_id
+    ).outerjoin(
+        _semesters, _semesters.c.semester_id == _results.c.semester_id
+    )
+    if student_id is not None:
+        stmt = stmt.where(_results.c.student_id == student_id)
+    stmt = stmt.order_by(_results.c.student_id, _results.c.result_id).offset(skip).limit(limit)
+
+    course_start = len(RESULT_FIELDS)
+    semester_start = course_start + len(COURSE_FIELDS)
+
+    rows = []
+    for row in db.execute(stmt):
+        result = dict(zip(RESULT_FIELDS, row[:course_start]))
+        # Orphaned references come back as all-NULL columns; the schema then has None
+        result["course"] = dict(zip(COURSE_FIELDS, row[course_start:semester_start])) if row[semester_start - 1] is not None else None
+        result["semester"] = dict(zip(SEMESTER_FIELDS, row[semester_start:])) if row[-1] is not None else None
+        rows.append(result)
+    return rows
+
+
+# --- Benchmark ---
+if __name__ == "__main__":
+    # Rows/sec for a 10k-row /results/ response: ORM + Pydantic (response_model) vs. this fast path.
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from fastapi.encoders import jsonable_encoder
+    import time
+    import schemas
+
+    ROWS = 10000
+
+    bench_engine = create_engine("sqlite:///:memory:")
+    models.Base.metadata.create_all(bind=bench_engine)
+    BenchSession = sessionmaker(autocommit=False, autoflush=False, bind=bench_engine)
+
+    with BenchSession() as db:
+        db.add(models.Semester(semester_id=1, semester_name="Bench", start_date=date(2023, 1, 1), end_date=date(2023, 5, 1)))
+        db.add_all([
+            models.Course(course_id=i, course_code=f"BEN{100 + i}", course_name=f"Bench {i}", credits=3, semester_offered=1, department="CS")
+            for i in range(1, 41)
+        ])
+        db.execute(_results.insert(), [
+            {"student_id": 1 + i // 40, "course_id": 1 + i % 40, "semester_id": 1, "grade": "B", "grade_point": 3.0, "credits": 3}
+            for i in range(ROWS)
+        ])
+        db.commit()
+
+    def orm_path() -> bytes:
+        with BenchSession() as db:
+            results = db.query(models.Result).limit(ROWS).all()
+            validated = [schemas.ResultResponse.from_orm(result) for result in results]
+            return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+    def fast_path() -> bytes:
+        with BenchSession() as db:
+            return FastJSONResponse(result_rows(db, limit=ROWS)).body
+
+    # Both paths must produce the same document
+    assert json.dumps(json.loads(orm_path())) == json.dumps(json.loads(fast_path()))
+
+    print(f"--- Serialization Benchmark ({ROWS} results, orjson {'on' if orjson else 'off'}) ---")
+    for label, path in (("ORM + Pydantic", orm_path), ("Core + FastJSONResponse", fast_path)):
+        runs = 5
+        start = time.perf_counter()
+        for _ in range(runs):
+            path()
+        elapsed = (time.perf_counter() - start) / runs
+        print(f"{label}: {elapsed * 1000:.1f} ms per response, {ROWS / elapsed:,.0f} rows/sec")
@@ -0,0 +1,470 @@
+from sqlalchemy import bindparam, create_engine, func, make_url, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+from typing import Callable, Dict, List, Optional, Set
+import os
+import re
+import threading
+import models, changes, blocking, database, grading
+
+# Optional sharding by department.
+#
+# Shard "main" is always the regular database (database.engine). It holds the student directory
+# and is the source of truth for the catalog (semesters, courses, prerequisites, grading scales).
+# Every other shard is a separate database holding:
+#   - the students of its departments and all their results (partitioned data)
+#   - a copy of the catalog (replicated data)
+# so dashboards and eligibility checks for one student only ever touch one shard.
+# Student and result ids are allocated globally by main. Change log ids are per shard
+# (the /changes cursor keeps a position per shard).
+#
+# Configuration (environment variables):
+#   SHARD_URL_TEMPLATE  database URL per shard, e.g. "sqlite:///shards/{shard}.db" (one file per shard).
+#                       Must contain "{shard}". Unset = sharding disabled, everything lives in "main".
+#                       Requires a persistent main database (DATABASE_URL, see database.py): the directory
+#                       and id sequences live there, and shard files would outlive an in-memory main.
+#   SHARD_MAP           optional explicit routing, e.g. "CS=science,Math=science".
+#                       Unmapped departments get a shard of their own.
+
+MAIN_SHARD = changes.MAIN_SHARD
+
+# Tables copied from main to every shard
+CATALOG_MODELS = (models.Semester, models.Course, models.Prerequisite, models.GradingScale, models.GradeBand)
+
+
+def _in_memory(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def _primary_key(table):
+    return list(table.primary_key.columns)[0]
+
+
+def shard_name(department: str) -> str:
+    """
+    Default shard of a department: its name, reduced to characters safe for file names.
+    """
+    return re.sub(r"[^a-z0-9]+", "_", department.lower()).strip("_") or MAIN_SHARD
+
+
+def parse_shard_map(value: Optional[str]) -> Dict[str, str]:
+    """
+    Parses "Dept=shard,Dept2=shard" into a dict.
+    """
+    shard_map = {}
+    for entry in (value or "").split(","):
+        if "=" in entry:
+            department, shard = entry.split("=", 1)
+            shard_map[department.strip()] = shard.strip()
+    return shard_map
+
+
+class ShardRouter:
+    """
+    Routes sessions to shards by department and keeps one engine (and so one connection pool) per shard.
+    """
+
+    def __init__(self, url_template: Optional[str] = None, shard_map: Optional[Dict[str, str]] = None,
+                 main_session=database.SessionLocal, pool_size: int = 5):
+        if url_template is not None and "{shard}" not in url_template:
+            raise ValueError("SHARD_URL_TEMPLATE must contain '{shard}', e.g. sqlite:///shards/{shard}.db")
+        if url_template is not None and _in_memory(main_session.kw["bind"].url):
+            raise ValueError("Sharding needs a persistent main database; set DATABASE_URL (see database.py).")
+        self.url_template = url_template
+        self.shard_map = dict(shard_map or {})
+        self.pool_size = pool_size
+        self._sessionmakers = {MAIN_SHARD: main_session}
+        self._lock = threading.Lock()
+        # Directory caches, so student-scoped requests only open the student's shard.
+        # Entries never change once written (a student's department is fixed), only released.
+        self._departments: Dict[int, Optional[str]] = {}
+        self._directory_shards: Optional[Set[str]] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.url_template is not None
+
+    # --- Routing ---
+
+    def shard_for(self, department: Optional[str]) -> str:
+        if not self.enabled or department is None:
+            return MAIN_SHARD
+        return self.shard_map.get(department) or shard_name(department)
+
+    def add_department(self, department: str, shard: Optional[str] = None) -> str:
+        """
+        Assigns a department to a shard (its own by default) and creates the shard if needed.
+        """
+        if not self.enabled:
+            raise ValueError("Sharding is disabled (SHARD_URL_TEMPLATE is not set).")
+        self.shard_map[department] = shard or shard_name(department)
+        self._sessionmaker(self.shard_map[department])
+        return self.shard_map[department]
+
+    def shard_for_student(self, student_id: int) -> str:
+        """
+        Shard holding the student. Unknown students resolve to main, where the caller's lookup then finds nothing.
+        """
+        return self.shard_for(self.student_department(student_id))
+
+    def session_for_shard(self, shard: str) -> Session:
+        return self._sessionmaker(shard)()
+
+    def session_for_department(self, department: Optional[str]) -> Session:
+        return self.session_for_shard(self.shard_for(department))
+
+    def session_for_student(self, student_id: int) -> Session:
+        return self.session_for_shard(self.shard_for_student(student_id))
+
+    def student_department(self, student_id: int) -> Optional[str]:
+        if not self.enabled:
+            return None
+        if student_id in self._departments:
+            return self._departments[student_id]
+
+        # Not seen by this process yet (or unknown): ask the directory. Misses are not cached.
+        with self._sessionmakers[MAIN_SHARD]() as db:
+            entry = db.query(models.StudentDirectory).filter(models.StudentDirectory.student_id == student_id).first()
+            if entry is None:
+                return None
+            self._remember(entry.student_id, entry.department)
+            return entry.department
+
+    def _remember(self, student_id: int, department: Optional[str]) -> None:
+        with self._lock:
+            self._departments[student_id] = department
+            if self._directory_shards is not None:
+                self._directory_shards.add(self.shard_for(department))
+
+    def allocate_student_id(self, department: Optional[str], email: str, student_id: Optional[int] = None) -> Optional[int]:
+        """
+        Registers a new student in the directory and returns their globally unique id
+        (a fixed `student_id` can be given, e.g. by the seeders).
+        Returns `student_id` unchanged when sharding is disabled (the database assigns ids as usual).
+        If the student row then cannot be written, call release_student_id().
+
+        Raises:
+            ValueError if the email, or the fixed id, is already registered on any shard.
+        """
+        if not self.enabled:
+            return student_id
+        with self._sessionmakers[MAIN_SHARD]() as db:
+            if db.query(models.StudentDirectory).filter(models.StudentDirectory.email == email).first():
+                raise ValueError(f"A student with email '{email}' already exists.")
+
+            entry = models.StudentDirectory(student_id=student_id, department=department, email=email)
+            db.add(entry)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Lost a race for the same email, or the fixed id is taken
+                db.rollback()
+                if db.query(models.StudentDirectory).filter(models.StudentDirectory.email == email).first():
+                    raise ValueError(f"A student with email '{email}' already exists.")
+                raise ValueError(f"Student id {student_id} is already registered.")
+            self._remember(entry.student_id, department)
+            return entry.student_id
+
+    def release_student_id(self, student_id: Optional[int]) -> None:
+        """
+        Removes a directory entry whose student row was never written.
+        """
+        if not self.enabled or student_id is None:
+            return
+        with self._sessionmakers[MAIN_SHARD]() as db:
+            db.query(models.StudentDirectory).filter(models.StudentDirectory.student_id == student_id).delete()
+            db.commit()
+        with self._lock:
+            self._departments.pop(student_id, None)
+
+    def allocate_result_ids(self, count: int) -> Optional[List[int]]:
+        """
+        Reserves `count` consecutive result ids that are unique across all shards.
+        Returns None when sharding is disabled (the database assigns ids as usual).
+        """
+        if not self.enabled or count == 0:
+            return None
+
+        sequence = models.IdSequence.__table__
+        advance = sequence.update().where(sequence.c.name == "results").values(next_id=sequence.c.next_id + count)
+
+        with self._sessionmakers[MAIN_SHARD]() as db:
+            # A single UPDATE, so concurrent allocations never hand out the same block
+            if db.execute(advance).rowcount == 0:
+                db.rollback()
+                # First use: continue after the highest result id on any shard
+                highest = self.run_all(lambda shard_db: shard_db.query(func.max(models.Result.result_id)).scalar() or 0)
+                try:
+                    db.execute(sequence.insert().values(name="results", next_id=max(highest.values()) + 1))
+                    db.commit()
+                except IntegrityError:
+                    db.rollback() # Initialised concurrently
+                db.execute(advance)
+
+            next_id = db.execute(select(sequence.c.next_id).where(sequence.c.name == "results")).scalar()
+            db.commit()
+        return list(range(next_id - count, next_id))
+
+    # --- Shards and pools ---
+
+    def shards(self) -> List[str]:
+        """
+        All shards that hold data: main, configured ones, and those of directory departments.
+        Only main when sharding is disabled (a SHARD_MAP alone has no effect).
+        The directory is read once; shards created later are known through their pools.
+        """
+        if not self.enabled:
+            return [MAIN_SHARD]
+
+        if self._directory_shards is None:
+            with self._sessionmakers[MAIN_SHARD]() as db:
+                departments = db.query(models.StudentDirectory.department).distinct().all()
+            with self._lock:
+                self._directory_shards = {self.shard_for(department) for (department,) in departments}
+
+        with self._lock:
+            names = {MAIN_SHARD} | set(self.shard_map.values()) | set(self._sessionmakers) | self._directory_shards
+        return sorted(names)
+
+    def _sessionmaker(self, shard: str):
+        with self._lock:
+            factory = self._sessionmakers.get(shard)
+            if factory is None:
+                factory = sessionmaker(autocommit=False, autoflush=False, bind=self._create_engine(shard),
+                                       info={"shard": shard})
+                models.Base.metadata.create_all(bind=factory.kw["bind"])
+                changes.track_changes(factory)
+                blocking.track_blocking(factory)
+                self._sessionmakers[shard] = factory
+                self._apply_catalog(shard, self._read_catalog(CATALOG_MODELS), full=True)
+            return factory
+
+    def _create_engine(self, shard: str):
+        url = make_url(self.url_template.format(shard=shard))
+
+        connect_args = {}
+        if url.get_backend_name() == "sqlite":
+            connect_args["check_same_thread"] = False
+            if url.database and url.database != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+
+        return create_engine(url, connect_args=connect_args, poolclass=QueuePool, pool_size=self.pool_size)
+
+    def dispose(self) -> None:
+        """
+        Closes the connection pools of all shards except main.
+        """
+        with self._lock:
+            for shard, factory in list(self._sessionmakers.items()):
+                if shard != MAIN_SHARD:
+                    factory.kw["bind"].dispose()
+                    del self._sessionmakers[shard]
+
+    # --- Catalog replication ---
+
+    def _read_catalog(self, catalog_models, ids: Optional[List[int]] = None) -> Dict:
+        """
+        Reads catalog rows from main: whole tables, or only the rows with primary keys in `ids`.
+        """
+        catalog = {}
+        with self._sessionmakers[MAIN_SHARD]() as source:
+            for model in catalog_models:
+                table = model.__table__
+                query = select(table)
+                if ids is not None:
+                    query = query.where(_primary_key(table).in_(ids))
+                catalog[model] = [dict(row._mapping) for row in source.execute(query)]
+        return catalog
+
+    def _apply_catalog(self, shard: str, catalog: Dict, full: bool) -> None:
+        """
+        Upserts catalog rows into a shard: new rows are inserted, changed rows updated, unchanged
+        rows left alone. On a full sync, rows gone from main are deleted as well.
+        Rows that results still reference are never deleted and re-inserted.
+        """
+        prerequisites_changed = False
+        scales_changed = False
+        upserts = []
+
+        with self._sessionmakers[shard].kw["bind"].begin() as target:
+            # 1. Diff against the shard's current rows
+            for model in CATALOG_MODELS:
+                if model not in catalog:
+                    continue
+                table = model.__table__
+                key = _primary_key(table)
+                rows = catalog[model]
+
+                query = select(table)
+                if not full:
+                    query = query.where(key.in_([row[key.name] for row in rows]))
+                existing = {row._mapping[key.name]: dict(row._mapping) for row in target.execute(query)}
+
+                inserts = [row for row in rows if row[key.name] not in existing]
+                updates = [
+                    {**row, "_key": row[key.name]}
+                    for row in rows if row[key.name] in existing and existing[row[key.name]] != row
+                ]
+                stale = set(existing) - {row[key.name] for row in rows} if full else set()
+                upserts.append((table, key, inserts, updates, stale))
+
+                if model is models.Prerequisite and (inserts or updates or stale):
+                    prerequisites_changed = True
+                if model in (models.GradingScale, models.GradeBand) and (inserts or updates or stale):
+                    scales_changed = True
+
+            # 2. Delete rows gone from main, children before parents
+            for table, key, inserts, updates, stale in reversed(upserts):
+                if stale:
+                    target.execute(table.delete().where(key.in_(stale)))
+
+            # 3. Insert and update, parents before children
+            for table, key, inserts, updates, stale in upserts:
+                if inserts:
+                    target.execute(table.insert(), inserts)
+                if updates:
+                    target.execute(table.update().where(key == bindparam("_key")), updates)
+
+        if scales_changed:
+            # Core writes bypass the change log hooks, so drop the cached grade tables here.
+            # A table loaded from this shard before the copy committed would otherwise stay cached.
+            grading.invalidate_tables()
+
+        if prerequisites_changed:
+            with self._sessionmakers[shard]() as db:
+                blocking.rebuild_index(db)
+                db.commit()
+
+    def sync_catalog(self, *catalog_models, ids: Optional[List[int]] = None) -> None:
+        """
+        Propagates catalog writes made in main to every other shard.
+        Without arguments every catalog table is synchronised (including deletions).
+        Pass the changed table(s), and optionally the changed ids, to copy just those rows,
+        e.g. sync_catalog(models.Course, ids=[course_id]) after creating a course.
+        """
+        if not self.enabled:
+            return
+
+        catalog = self._read_catalog(catalog_models or CATALOG_MODELS, ids)
+        for shard in self.shards():
+            if shard == MAIN_SHARD:
+                continue
+            if shard in self._sessionmakers:
+                self._apply_catalog(shard, catalog, full=ids is None)
+            else:
+                self._sessionmaker(shard) # A new shard copies the whole catalog on creation
+
+    # --- Cross-shard helpers (for the few global views) ---
+
+    def query_all(self, fn: Callable[[Session], List]) -> List:
+        """
+        Runs fn(db) on every shard and concatenates the results.
+        """
+        rows = []
+        for shard in self.shards():
+            with self._sessionmaker(shard)() as db:
+                rows.extend(fn(db))
+        return rows
+
+    def run_all(self, fn: Callable[[Session], object]) -> Dict[str, object]:
+        """
+        Runs fn(db) on every shard (e.g., a regrade) and returns the result of each shard.
+        """
+        outcome = {}
+        for shard in self.shards():
+            with self._sessionmaker(shard)() as db:
+                outcome[shard] = fn(db)
+        return outcome
+
+
+# The application's router. Without SHARD_URL_TEMPLATE every department maps to main.
+router = ShardRouter(os.environ.get("SHARD_URL_TEMPLATE"), parse_shard_map(os.environ.get("SHARD_MAP")))
+
+
+# --- Benchmark ---
+if __name__ == "__main__":
+    # Compares a student dashboard (CGPA + eligibility for every course of the student's department)
+    # on one unsharded database vs. department shards, at 10 and 50 departments.
+    import random
+    import tempfile
+    import time
+    from datetime import date
+    import logic
+
+    STUDENTS_PER_DEPARTMENT = 40
+    COURSES_PER_DEPARTMENT = 8
+
+    def build(router: ShardRouter, departments: List[str]) -> List[int]:
+        with router.session_for_department(None) as db:
+            db.add(models.Semester(semester_id=1, semester_name="Bench", start_date=date(2023, 1, 1), end_date=date(2023, 5, 1)))
+            course_ids = {}
+            for department in departments:
+                courses = [
+                    models.Course(course_code=f"{department}{100 + i}", course_name=f"{department} {i}",
+                                  credits=3, semester_offered=1, department=department)
+                    for i in range(COURSES_PER_DEPARTMENT)
+                ]
+                db.add_all(courses)
+                db.flush()
+                # Each course requires the previous one
+                db.add_all([
+                    models.Prerequisite(course_id=courses[i].course_id, prerequisite_course_id=courses[i - 1].course_id)
+                    for i in range(1, len(courses))
+                ])
+                course_ids[department] = [c.course_id for c in courses]
+            db.commit()
+        router.sync_catalog()
+
+        student_ids = []
+        for department in departments:
+            ids = [router.allocate_student_id(department, f"{department}{n}@uni.edu") for n in range(STUDENTS_PER_DEPARTMENT)]
+            with router.session_for_department(department) as db:
+                for n, student_id in enumerate(ids):
+                    student = models.Student(first_name="S", last_name=str(n), email=f"{department}{n}@uni.edu",
+                                             enrollment_year=2023, level=200, department=department)
+                    if student_id is not None:
+                        student.student_id = student_id
+                    db.add(student)
+                    db.flush()
+                    student_ids.append(student.student_id)
+                    for course_id in course_ids[department][:4]:
+                        grade = random.choice("ABCDF")
+                        db.add(models.Result(student_id=student.student_id, course_id=course_id, semester_id=1,
+                                             grade=grade, grade_point=grading.DEFAULT_BANDS[grade], credits=3))
+                db.commit()
+        return student_ids
+
+    def dashboard(router: ShardRouter, student_id: int) -> None:
+        with router.session_for_student(student_id) as db:
+            student = db.query(models.Student).filter(models.Student.student_id == student_id).first()
+            logic.calculate_student_cgpa(student_id, db)
+            courses = db.query(models.Course).filter(models.Course.department == student.department).all()
+            for course in courses:
+                logic.check_course_eligibility(student_id, course.course_id, db)
+
+    print("--- Sharding Benchmark (student dashboard) ---")
+    for department_count in (10, 50):
+        departments = [f"D{i:02d}" for i in range(department_count)]
+        timings = {}
+        for label in ("unsharded", "sharded"):
+            workdir = tempfile.mkdtemp()
+            main_engine = create_engine(f"sqlite:///{workdir}/main.db", connect_args={"check_same_thread": False})
+            models.Base.metadata.create_all(bind=main_engine)
+            main_session = sessionmaker(autocommit=False, autoflush=False, bind=main_engine)
+            template = f"sqlite:///{workdir}/{{shard}}.db" if label == "sharded" else None
+            bench_router = ShardRouter(template, main_session=main_session)
+
+            random.seed(1)
+            student_ids = build(bench_router, departments)
+            sample = random.sample(student_ids, 200)
+
+            start = time.perf_counter()
+            for student_id in sample:
+                dashboard(bench_router, student_id)
+            timings[label] = (time.perf_counter() - start) / len(sample) * 1000
+            bench_router.dispose()
+            main_engine.dispose()
+
+        print(f"{department_count} departments: unsharded {timings['unsharded']:.2f} ms, "
+              f"sharded {timings['sharded']:.2f} ms per dashboard")